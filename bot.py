@@ -1,11 +1,12 @@
 # bot.py
+import asyncio
 import os
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 
 from utils.errors import WrongChannel
-from utils.logger import log_error
+from utils.logger import log_error, flush_logs, periodic_log_prune
 
 load_dotenv()
 BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
@@ -14,7 +15,18 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+
+class ExchangeBot(commands.Bot):
+    async def close(self):
+        """Close the Discord session, flush queued logs, then close the pooled DB connections."""
+        from utils.database import writer, readers
+        await super().close()
+        await flush_logs()
+        await writer.close()
+        await readers.close()
+
+
+bot = ExchangeBot(command_prefix="!", intents=intents)
 
 # =====================================================
 # GLOBAL CHECK: Restrict commands to #toilet-exchange
@@ -67,6 +79,9 @@ initial_extensions = [
 @bot.event
 async def setup_hook():
     """Load cogs on startup"""
+    # Keep a reference so the pruning task isn't garbage-collected
+    bot.log_prune_task = asyncio.create_task(periodic_log_prune())
+
     for ext in initial_extensions:
         try:
             await bot.load_extension(ext)
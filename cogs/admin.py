@@ -1,13 +1,13 @@
 # cogs/admin.py
 import datetime
 import random
-import aiosqlite
 import discord
 from discord import NotFound, HTTPException, Forbidden
 from discord.ext import commands
 from utils.database import (
-    DB_PATH, DEFAULT_STOCKS,
+    writer, readers, DEFAULT_STOCKS, UPDATE_BALANCE_SQL,
     update_server_setting, get_server_settings,
+    invalidate_stock_prices, invalidate_server_settings,
     add_admin, remove_admin, list_admins, is_admin  # new admin helpers
 )
 from utils.helpers import dm_and_delete, resolve_member
@@ -160,10 +160,10 @@ class Admin(commands.Cog):
             return await dm_and_delete(ctx, "❌ Invalid format. Example: `!add_stock GMD GOMADINC 150 high`")
 
         try:
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with writer.acquire() as db:
                 await db.execute(
                     "INSERT OR IGNORE INTO stocks(ticker, name, price, risk, guild_id) VALUES(?, ?, ?, ?, ?)",
-                    (ticker.upper(), name, price, risk, str(ctx.guild.id)),
+                    (ticker.upper(), name, price, risk, ctx.guild.id),
                 )
                 await db.commit()
             await dm_and_delete(ctx, f"✅ Added `{ticker.upper()}` — **{name}** (${price:.2f}, {risk})")
@@ -176,12 +176,13 @@ class Admin(commands.Cog):
     @bot_admin()
     async def set_price(self, ctx, ticker: str, price: float):
         try:
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with writer.acquire() as db:
                 await db.execute(
                     "UPDATE stocks SET price=? WHERE ticker=? AND guild_id=?",
-                    (price, ticker.upper(), str(ctx.guild.id)),
+                    (price, ticker.upper(), ctx.guild.id),
                 )
                 await db.commit()
+            invalidate_stock_prices(ctx.guild.id)
             await dm_and_delete(ctx, f"✅ `{ticker.upper()}` set to ${price:.2f}")
             await log_event("INFO", f"Price updated {ticker.upper()}", ctx)
         except Exception as e:
@@ -196,10 +197,10 @@ class Admin(commands.Cog):
         if risk not in ("low", "moderate", "high"):
             return await dm_and_delete(ctx, "❌ Invalid risk level.")
         try:
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with writer.acquire() as db:
                 await db.execute(
                     "UPDATE stocks SET risk=? WHERE ticker=? AND guild_id=?",
-                    (risk, ticker.upper(), str(ctx.guild.id)),
+                    (risk, ticker.upper(), ctx.guild.id),
                 )
                 await db.commit()
             await dm_and_delete(ctx, f"✅ `{ticker.upper()}` risk set to {risk}.")
@@ -215,38 +216,37 @@ class Admin(commands.Cog):
         """Remove a stock from the market. !remove_stock <TICKER>"""
         ticker = ticker.upper()
         try:
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with readers.acquire() as db:
                 cur = await db.execute(
                     "SELECT price FROM stocks WHERE ticker=? AND guild_id=?",
-                    (ticker, str(ctx.guild.id)),
+                    (ticker, ctx.guild.id),
                 )
                 row = await cur.fetchone()
-                if not row:
-                    return await dm_and_delete(ctx, f"❌ Stock `{ticker}` not found.")
-                price = row[0]
-
-                cur = await db.execute("""
-                    SELECT user_id, SUM(CASE WHEN side='BUY' THEN qty ELSE -qty END)
-                    FROM trades
-                    WHERE ticker=? AND guild_id=?
-                    GROUP BY user_id
-                """, (ticker, str(ctx.guild.id)))
+            # Reply outside the pooled block; dm_and_delete borrows a connection too
+            if not row:
+                return await dm_and_delete(ctx, f"❌ Stock `{ticker}` not found.")
+            price = row[0]
+
+            async with writer.acquire() as db:
+                cur = await db.execute(
+                    "SELECT user_id, qty FROM positions WHERE ticker=? AND guild_id=? AND qty > 0",
+                    (ticker, ctx.guild.id),
+                )
                 holders = await cur.fetchall()
 
-                for user_id, qty in holders:
-                    if qty <= 0:
-                        continue
-                    total_value = price * qty
-                    await db.execute(
-                        "UPDATE users SET cash=cash+? WHERE discord_id=? AND guild_id=?",
-                        (total_value, str(user_id), str(ctx.guild.id)),
-                    )
-                    await db.execute("""
-                        INSERT INTO trades(user_id, guild_id, ticker, qty, side, price)
-                        VALUES(?, ?, ?, ?, 'SELL', ?)
-                    """, (str(user_id), str(ctx.guild.id), ticker, qty, price))
-                await db.execute("DELETE FROM stocks WHERE ticker=? AND guild_id=?", (ticker, str(ctx.guild.id)))
+                # Cash out every holder in two batched statements
+                await db.executemany(
+                    UPDATE_BALANCE_SQL,
+                    [(price * qty, user_id, ctx.guild.id) for user_id, qty in holders],
+                )
+                await db.executemany("""
+                    INSERT INTO trades(user_id, guild_id, ticker, qty, side, price)
+                    VALUES(?, ?, ?, ?, 'SELL', ?)
+                """, [(user_id, ctx.guild.id, ticker, qty, price) for user_id, qty in holders])
+                await db.execute("DELETE FROM positions WHERE ticker=? AND guild_id=?", (ticker, ctx.guild.id))
+                await db.execute("DELETE FROM stocks WHERE ticker=? AND guild_id=?", (ticker, ctx.guild.id))
                 await db.commit()
+            invalidate_stock_prices(ctx.guild.id)
 
             await dm_and_delete(ctx, f"✅ `{ticker}` removed and holders cashed out.")
         except Exception as e:
@@ -261,13 +261,14 @@ class Admin(commands.Cog):
     async def reset_stocks(self, ctx):
         """Reset all stocks in the market to the original values. -- will be updated to keep added and removed stocks as well"""
         try:
-            async with aiosqlite.connect(DB_PATH) as db:
-                await db.execute("DELETE FROM stocks WHERE guild_id=?", (str(ctx.guild.id),))
+            async with writer.acquire() as db:
+                await db.execute("DELETE FROM stocks WHERE guild_id=?", (ctx.guild.id,))
                 await db.executemany(
                     "INSERT INTO stocks(ticker, name, price, risk, guild_id) VALUES (?, ?, ?, ?, ?)",
-                    [(t, n, p, r, str(ctx.guild.id)) for (t, n, p, r) in DEFAULT_STOCKS],
+                    [(t, n, p, r, ctx.guild.id) for (t, n, p, r) in DEFAULT_STOCKS],
                 )
                 await db.commit()
+            invalidate_stock_prices(ctx.guild.id)
             await dm_and_delete(ctx, "✅ Stock market reset for this server.")
             await log_event("INFO", f"Reset market for {ctx.guild.name}", ctx)
         except Exception as e:
@@ -283,33 +284,38 @@ class Admin(commands.Cog):
         """Start a market crash! Can only be used once per calendar year."""
         year = datetime.datetime.now().year
         try:
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with readers.acquire() as db:
                 cur = await db.execute(
                     "SELECT COUNT(*) FROM market_events WHERE event_type='crash' AND year=? AND guild_id=?",
-                    (year, str(ctx.guild.id)),
+                    (year, ctx.guild.id),
                 )
-                if (await cur.fetchone())[0] > 0:
-                    return await dm_and_delete(ctx, "Crash already triggered this year.")
+                already_crashed = (await cur.fetchone())[0] > 0
 
-                cur = await db.execute("SELECT ticker, price FROM stocks WHERE guild_id=?", (str(ctx.guild.id),))
+                cur = await db.execute("SELECT ticker, price FROM stocks WHERE guild_id=?", (ctx.guild.id,))
                 stocks = await cur.fetchall()
-                if not stocks:
-                    return await dm_and_delete(ctx, "❌ No stocks to crash.")
 
+            # Reply outside the pooled block; dm_and_delete borrows a connection too
+            if already_crashed:
+                return await dm_and_delete(ctx, "Crash already triggered this year.")
+            if not stocks:
+                return await dm_and_delete(ctx, "❌ No stocks to crash.")
+
+            async with writer.acquire() as db:
                 crashed = []
                 for ticker, price in stocks:
                     new_price = round(price * random.uniform(0.3, 0.6), 2)
                     await db.execute(
                         "UPDATE stocks SET price=? WHERE ticker=? AND guild_id=?",
-                        (new_price, ticker, str(ctx.guild.id)),
+                        (new_price, ticker, ctx.guild.id),
                     )
                     crashed.append((ticker, price, new_price))
 
                 await db.execute(
                     "INSERT INTO market_events(event_type, year, guild_id) VALUES('crash', ?, ?)",
-                    (year, str(ctx.guild.id)),
+                    (year, ctx.guild.id),
                 )
                 await db.commit()
+            invalidate_stock_prices(ctx.guild.id)
 
             embed = discord.Embed(
                 title="💥 MARKET CRASH!",
@@ -351,7 +357,7 @@ class Admin(commands.Cog):
             return await dm_and_delete(ctx, "❌ Usage: `!set_setting <setting> <value>`")
         try:
             settings = await get_server_settings(ctx.guild.id)
-            if setting not in settings:
+            if setting not in settings or setting == "guild_id":
                 valid = ", ".join([k for k in settings.keys() if k != "guild_id"])
                 return await dm_and_delete(ctx, f"❌ Invalid setting. Options: {valid}")
             try:
@@ -398,13 +404,14 @@ class Admin(commands.Cog):
                 return await ctx.send("⏱️ Reset cancelled — no confirmation received.")
 
             try:
-                async with aiosqlite.connect(DB_PATH) as db:
-                    gid = str(ctx.guild.id)
+                async with writer.acquire() as db:
+                    gid = ctx.guild.id
 
                     # Wipe per-guild tables
                     await db.execute("DELETE FROM users WHERE guild_id=?", (gid,))
                     await db.execute("DELETE FROM portfolios WHERE guild_id=?", (gid,))
                     await db.execute("DELETE FROM trades WHERE guild_id=?", (gid,))
+                    await db.execute("DELETE FROM positions WHERE guild_id=?", (gid,))
                     await db.execute("DELETE FROM stocks WHERE guild_id=?", (gid,))
                     await db.execute("DELETE FROM price_history WHERE guild_id=?", (gid,))
                     await db.execute("DELETE FROM leaderboard_cache WHERE guild_id=?", (gid,))
@@ -432,6 +439,8 @@ class Admin(commands.Cog):
                     )
 
                     await db.commit()
+                invalidate_stock_prices(gid)
+                invalidate_server_settings(gid)
 
                 await dm_and_delete(ctx, "🧻 Game reset complete! All data restored to defaults.")
                 await log_event("INFO", f"Full reset performed for {ctx.guild.name}", ctx)
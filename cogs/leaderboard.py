@@ -8,6 +8,7 @@ from utils.database import (
     get_server_settings,
     get_cached_leaderboard,  # ✅ Added import
 )
+from utils.helpers import get_exchange_channel
 from utils.logger import log_error
 
 
@@ -154,7 +155,7 @@ class Leaderboard(commands.Cog):
             if rows and rows[0][2]:
                 embed.set_footer(text=f"Cache last updated: {rows[0][2]} UTC")
 
-        channel = discord.utils.get(guild.text_channels, name="toilet-exchange")
+        channel = get_exchange_channel(guild)
         if channel:
             try:
                 await channel.send(embed=embed)
@@ -1,13 +1,20 @@
 # cogs/market.py
 import random
 import statistics
-import aiosqlite
 import matplotlib.pyplot as plt
 import io
 import discord
 from discord.ext import commands, tasks
-from utils.database import DB_PATH, get_moving_average, get_server_settings
-from utils.helpers import get_price_change_range
+from utils.database import (
+    writer,
+    readers,
+    get_moving_average,
+    get_recent_prices,
+    get_server_settings,
+    invalidate_stock_prices,
+    record_prices_tx,
+)
+from utils.helpers import get_price_change_range, get_exchange_channel
 from utils.logger import log_error
 import datetime
 
@@ -38,10 +45,10 @@ class Market(commands.Cog):
             rate = int(settings.get("market_update_rate", 1))  # in hours
 
             last_time = None
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with readers.acquire() as db:
                 cur = await db.execute(
                     "SELECT MAX(timestamp) FROM price_history WHERE guild_id=?",
-                    (str(guild.id),)
+                    (guild.id,)
                 )
                 row = await cur.fetchone()
                 if row and row[0]:
@@ -54,7 +61,7 @@ class Market(commands.Cog):
                         last_time = None
 
             # Always send patch message, but skip update unless it's really overdue
-            channel = discord.utils.get(guild.text_channels, name="toilet-exchange")
+            channel = get_exchange_channel(guild)
             if channel:
                 try:
                     await channel.send(patch_message)
@@ -97,10 +104,10 @@ class Market(commands.Cog):
                 last = self._last_market_update.get(guild.id)
 
                 # Load last update directly from DB instead of in-memory
-                async with aiosqlite.connect(DB_PATH) as db:
+                async with readers.acquire() as db:
                     cur = await db.execute(
                         "SELECT MAX(timestamp) FROM price_history WHERE guild_id=?",
-                        (str(guild.id),)
+                        (guild.id,)
                     )
                     row = await cur.fetchone()
                 last_update_time = None
@@ -128,10 +135,10 @@ class Market(commands.Cog):
     # -------------------------------------------------
     async def _update_prices_for_guild(self, guild, settings):
         """Update stock prices for a specific guild using adaptive dynamic median targets."""
-        guild_id = str(guild.id)
+        guild_id = guild.id
         market_sentiment = random.uniform(-0.002, 0.002)  # mild global mood swing
 
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with writer.acquire() as db:
             cur = await db.execute("SELECT ticker, price, risk FROM stocks WHERE guild_id=?", (guild_id,))
             stocks = await cur.fetchall()
 
@@ -143,25 +150,26 @@ class Market(commands.Cog):
             target_price = statistics.median(prices)
 
             mean_bias = float(settings.get("market_bias", 0.0008))
-            if guild.id not in self._momentum:
-                self._momentum[guild.id] = {}
+            momentum_by_ticker = self._momentum.setdefault(guild.id, {})
+            uniform = random.uniform
 
+            new_prices = []
             for ticker, price, risk in stocks:
                 # --- Volatility based on risk ---
                 low, high = get_price_change_range(risk)
-                raw_change = random.uniform(low, high) + market_sentiment
+                raw_change = uniform(low, high) + market_sentiment
 
                 # --- Local drift using stock-relative bias ---
-                base_target = price * random.uniform(0.95, 1.05)
+                base_target = price * uniform(0.95, 1.05)
                 drift_bias = mean_bias * ((base_target - price) / base_target)
 
                 # --- Recovery boost for low-value stocks ---
                 recovery_boost = 1.5 + (1.0 - price) if price < 1.0 else 1.0
 
                 # --- Momentum persistence (keeps trends alive briefly) ---
-                prev_mom = self._momentum[guild.id].get(ticker, 0)
+                prev_mom = momentum_by_ticker.get(ticker, 0)
                 momentum = 0.7 * prev_mom + 0.3 * (raw_change * price)
-                self._momentum[guild.id][ticker] = momentum
+                momentum_by_ticker[ticker] = momentum
 
                 # --- Volatility scaling by price ---
                 volatility_scale = 1 + (price / 500)
@@ -173,32 +181,14 @@ class Market(commands.Cog):
                 )
 
                 new_price = max(price + final_change, 0.01)
+                new_prices.append((ticker, new_price))
 
-                await db.execute(
-                    "UPDATE stocks SET price=? WHERE ticker=? AND guild_id=?",
-                    (round(new_price, 6), ticker, guild_id),
-                )
-                await db.execute(
-                    "INSERT INTO price_history (ticker, guild_id, price) VALUES (?, ?, ?)",
-                    (ticker, guild_id, new_price),
-                )
-
-            await db.commit()
-
-        # ✅ Market update announcement
-        channel = discord.utils.get(guild.text_channels, name="toilet-exchange")
-        if channel:
-            try:
-                await channel.send("The market has been updated! Check new prices with `!stocks`.")
-            except discord.Forbidden:
-                print(f"[Market] Missing permission to send message in {guild.name}.")
-            except Exception as e:
-                print(f"[Market] Error sending update message in {guild.name}: {e}")
-
+            await record_prices_tx(db, guild_id, new_prices)
             await db.commit()
+        invalidate_stock_prices(guild_id)
 
         # --- announce market update ---
-        channel = discord.utils.get(guild.text_channels, name="toilet-exchange")
+        channel = get_exchange_channel(guild)
         if channel:
             try:
                 await channel.send("📈 The market has been updated! Check new prices with `!stocks`.")
@@ -213,10 +203,10 @@ class Market(commands.Cog):
     @commands.command()
     async def price(self, ctx, ticker: str):
         """Get price for a stock."""
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with readers.acquire() as db:
             cur = await db.execute(
                 "SELECT price FROM stocks WHERE ticker=? AND guild_id=?",
-                (ticker.upper(), str(ctx.guild.id)),
+                (ticker.upper(), ctx.guild.id),
             )
             row = await cur.fetchone()
         if not row:
@@ -226,10 +216,10 @@ class Market(commands.Cog):
     @commands.command(name="stocks")
     async def list_stocks(self, ctx):
         """Show all active stocks for this guild."""
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with readers.acquire() as db:
             cur = await db.execute(
                 "SELECT ticker, name, price, risk FROM stocks WHERE guild_id=?",
-                (str(ctx.guild.id),),
+                (ctx.guild.id,),
             )
             rows = await cur.fetchall()
 
@@ -267,25 +257,17 @@ class Market(commands.Cog):
             return await ctx.send("Please specify at least one ticker or use `!trend all`.")
 
         tickers = [t.upper() for t in tickers]
-        guild_id = str(ctx.guild.id)
+        guild_id = ctx.guild.id
 
         if len(tickers) == 1 and tickers[0].lower() == "all":
-            async with aiosqlite.connect(DB_PATH) as db:
+            async with readers.acquire() as db:
                 cur = await db.execute("SELECT ticker FROM stocks WHERE guild_id=?", (guild_id,))
                 tickers = [r[0] for r in await cur.fetchall()]
             if not tickers:
                 return await ctx.send("No stocks found in this market.")
 
-        data = {}
-        async with aiosqlite.connect(DB_PATH) as db:
-            for ticker in tickers:
-                cur = await db.execute(
-                    "SELECT price FROM price_history WHERE ticker=? AND guild_id=? ORDER BY id DESC LIMIT 20",
-                    (ticker, guild_id),
-                )
-                rows = await cur.fetchall()
-                if rows:
-                    data[ticker] = list(reversed([r[0] for r in rows]))
+        history = await get_recent_prices(guild_id, tickers, limit=20)
+        data = {t: history[t] for t in tickers if t in history}
 
         if not data:
             return await ctx.send("No recent data found for the given tickers.")
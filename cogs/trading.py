@@ -1,16 +1,17 @@
 # cogs/trading.py
-import aiosqlite
 import discord
 from discord.ext import commands
 from utils.database import (
     get_user,
+    get_user_tx,
     create_user,
-    update_balance,
-    record_trade,
+    update_balance_tx,
+    record_trade_tx,
     get_stock_price,
-    get_server_settings,
-    DB_PATH,
+    SELECT_POSITION_SQL,
     ensure_guild_market,
+    writer,
+    readers,
 )
 from utils.helpers import dm_and_delete
 from utils.logger import log_error
@@ -35,14 +36,10 @@ class Trading(commands.Cog):
     async def register(self, ctx):
         """Register to participate in the Toilet Exchange"""
         await ensure_guild_market(ctx.guild.id)
-        user = await get_user(ctx.author.id, ctx.guild.id)
-        if user:
+        created = await create_user(ctx.author.id, ctx.guild.id)
+        if created is None:
             return await ctx.send("You already have an account!")
-
-        settings = await get_server_settings(ctx.guild.id)
-        starting_money = settings.get("starting_money", 1000.0)
-
-        await create_user(ctx.author.id, ctx.guild.id)
+        starting_money = created[1]
 
         embed = discord.Embed(
             title="Welcome to the Toilet Exchange!",
@@ -87,6 +84,8 @@ class Trading(commands.Cog):
         if qty <= 0:
             return await dm_and_delete(ctx, "❌ Quantity must be greater than 0.")
 
+        ticker = ticker.upper()
+
         user = await get_user(ctx.author.id, ctx.guild.id)
         if not user:
             return await ctx.send("No account found. Use !register.")
@@ -101,10 +100,23 @@ class Trading(commands.Cog):
         if float(user[1]) < total_cost:
             return await dm_and_delete(ctx, "❌ Insufficient funds for this purchase.")
 
-        await update_balance(ctx.author.id, ctx.guild.id, -total_cost)
-        result = await record_trade(ctx.author.id, ctx.guild.id, ticker.upper(), qty, "BUY")
+        # Re-check cash under the write lock so two quick buys can't both spend it
+        async with writer.acquire() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            user = await get_user_tx(db, ctx.author.id, ctx.guild.id)
+            funded = user is not None and user[1] >= total_cost
+            if funded:
+                await update_balance_tx(db, ctx.author.id, ctx.guild.id, -total_cost)
+                result = await record_trade_tx(db, ctx.author.id, ctx.guild.id, ticker, qty, "BUY")
+                await db.commit()
+
+        if user is None:
+            return await ctx.send("No account found. Use !register.")
+        if not funded:
+            return await dm_and_delete(ctx, "❌ Insufficient funds for this purchase.")
+
         await dm_and_delete(
-            ctx, f"✅ Bought {qty} × {ticker.upper()} for ${total_cost:.2f}.\n{result}"
+            ctx, f"✅ Bought {qty} × {ticker} for ${total_cost:.2f}.\n{result}"
         )
 
     # ----------------------------
@@ -126,6 +138,8 @@ class Trading(commands.Cog):
         if qty <= 0:
             return await dm_and_delete(ctx, "❌ Quantity must be greater than 0.")
 
+        ticker = ticker.upper()
+
         user = await get_user(ctx.author.id, ctx.guild.id)
         if not user:
             return await ctx.send("No account found. Use !register.")
@@ -134,21 +148,23 @@ class Trading(commands.Cog):
         if price is None:
             return await dm_and_delete(ctx, "❌ Invalid stock ticker for this server.")
 
-        ticker = ticker.upper()
-        async with aiosqlite.connect(DB_PATH) as db:
-            cur = await db.execute("""
-                SELECT SUM(CASE WHEN side='BUY' THEN qty ELSE -qty END)
-                FROM trades
-                WHERE user_id=? AND guild_id=? AND ticker=?
-            """, (str(ctx.author.id), str(ctx.guild.id), ticker))
-            owned = (await cur.fetchone())[0] or 0
+        # Check and sell under one write lock so two quick sells can't both pass the check
+        total_gain = price * qty
+        async with writer.acquire() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            cur = await db.execute(
+                SELECT_POSITION_SQL, (ctx.author.id, ctx.guild.id, ticker)
+            )
+            row = await cur.fetchone()
+            owned = row[0] if row else 0
+            if owned >= qty:
+                await update_balance_tx(db, ctx.author.id, ctx.guild.id, total_gain)
+                result = await record_trade_tx(db, ctx.author.id, ctx.guild.id, ticker, qty, "SELL")
+                await db.commit()
 
         if owned < qty:
             return await dm_and_delete(ctx, f"❌ You only own {owned} shares of {ticker}.")
 
-        total_gain = price * qty
-        await update_balance(ctx.author.id, ctx.guild.id, total_gain)
-        result = await record_trade(ctx.author.id, ctx.guild.id, ticker, qty, "SELL")
         await dm_and_delete(
             ctx, f"✅ Sold {qty} × {ticker} for ${total_gain:.2f}.\n{result}"
         )
@@ -159,10 +175,10 @@ class Trading(commands.Cog):
     @commands.command()
     async def portfolio(self, ctx):
         """Show your current portfolio"""
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with readers.acquire() as db:
             cur = await db.execute(
                 "SELECT cash FROM users WHERE discord_id=? AND guild_id=?",
-                (str(ctx.author.id), str(ctx.guild.id)),
+                (ctx.author.id, ctx.guild.id),
             )
             user_row = await cur.fetchone()
             if not user_row:
@@ -170,12 +186,11 @@ class Trading(commands.Cog):
             cash = user_row[0]
 
             cur = await db.execute("""
-                SELECT t.ticker, s.name, SUM(CASE WHEN t.side='BUY' THEN t.qty ELSE -t.qty END)
-                FROM trades t
-                LEFT JOIN stocks s ON t.ticker = s.ticker AND s.guild_id = t.guild_id
-                WHERE t.user_id=? AND t.guild_id=?
-                GROUP BY t.ticker, s.name
-            """, (str(ctx.author.id), str(ctx.guild.id)))
+                SELECT p.ticker, s.name, IFNULL(s.price, 0), p.qty
+                FROM positions p
+                LEFT JOIN stocks s ON p.ticker = s.ticker AND s.guild_id = p.guild_id
+                WHERE p.user_id=? AND p.guild_id=? AND p.qty > 0
+            """, (ctx.author.id, ctx.guild.id))
             holdings = await cur.fetchall()
 
         embed = discord.Embed(
@@ -189,10 +204,9 @@ class Trading(commands.Cog):
             embed.set_footer(text=f"Total Value: ${cash:.2f}")
             return await dm_and_delete(ctx, embed=embed)
 
-        for ticker, name, qty in holdings:
+        for ticker, name, price, qty in holdings:
             if qty <= 0:
                 continue
-            price = await get_stock_price(ticker, ctx.guild.id) or 0
             value = price * qty
             total_value += value
             embed.add_field(
@@ -210,9 +224,10 @@ class Trading(commands.Cog):
     @commands.command()
     async def delete_account(self, ctx):
         """Delete your account and all data for this server"""
-        user_id, guild_id = str(ctx.author.id), str(ctx.guild.id)
-        async with aiosqlite.connect(DB_PATH) as db:
+        user_id, guild_id = ctx.author.id, ctx.guild.id
+        async with writer.acquire() as db:
             await db.execute("DELETE FROM trades WHERE user_id=? AND guild_id=?", (user_id, guild_id))
+            await db.execute("DELETE FROM positions WHERE user_id=? AND guild_id=?", (user_id, guild_id))
             await db.execute(
                 "DELETE FROM portfolios WHERE user_id=(SELECT id FROM users WHERE discord_id=? AND guild_id=?)",
                 (user_id, guild_id),
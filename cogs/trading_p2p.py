@@ -1,14 +1,67 @@
 # cogs/trading_p2p.py
+import asyncio
+import itertools
+from dataclasses import dataclass, field
 import discord
 from discord.ext import commands
-import aiosqlite
-from utils.database import DB_PATH, get_user, update_balance, record_trade
+from utils.database import (
+    writer,
+    get_balances_tx,
+    get_holdings_tx,
+    transfer_cash_tx,
+    record_trades_tx,
+)
 from utils.helpers import resolve_member
 from utils.logger import log_error
 
+def _empty_offer():
+    return {"cash": 0, "stocks": {}}
+
+
+@dataclass(slots=True)
+class TradeSession:
+    """State for one person-to-person trade."""
+    initiator_id: int
+    partner_id: int | None
+    mode: str  # "open" or "targeted"
+    status: str = "pending"  # "pending" until a partner joins, then "active"
+    initiator_offer: dict = field(default_factory=_empty_offer)
+    partner_offer: dict = field(default_factory=_empty_offer)
+    initiator_accepted: bool = False
+    partner_accepted: bool = False
+    message: discord.Message | None = None
+    # Members are resolved once so embeds don't depend on the member cache mid-trade
+    initiator_member: discord.Member | None = None
+    partner_member: discord.Member | None = None
+    pending_edit: asyncio.Task | None = None
+    # Offer embed built once when the partner joins and updated in place afterwards
+    embed: discord.Embed | None = None
+
+    def offer_for(self, user_id):
+        """Return the offer dict belonging to `user_id`'s side of the trade."""
+        return self.initiator_offer if user_id == self.initiator_id else self.partner_offer
+
+
+# Rapid !trade offers within this window collapse into a single message edit
+EDIT_DEBOUNCE_SECONDS = 0.25
+
 # Active trades tracked per guild to prevent cross-server mixups
-# Structure: {guild_id: {initiator_id: trade_data}}
-active_trades = {}
+# Structure: {guild_id: {initiator_id: TradeSession}}
+active_trades: dict[int, dict[int, TradeSession]] = {}
+# Which trade each participant is in, so either side resolves to the one session.
+# Structure: {guild_id: {user_id: initiator_id}}
+user_index: dict[int, dict[int, int]] = {}
+
+# One lock per guild serialises trade commands, so an !accept can't land while
+# another command for the same trades is mid-await (e.g. finalizing twice)
+_trade_locks: dict[int, asyncio.Lock] = {}
+
+# Pending trades still waiting for a partner, indexed so trade_accept needn't scan.
+# Dicts are used as insertion-ordered sets so the oldest trade is joined first.
+# Structure: {guild_id: {initiator_id: None}}
+open_trades: dict[int, dict[int, None]] = {}
+# Structure: {guild_id: {target_id: {initiator_id: None}}}
+targeted_trades: dict[int, dict[int, dict[int, None]]] = {}
 
 
 class PlayerTrading(commands.Cog):
@@ -16,6 +69,7 @@ class PlayerTrading(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self._background = set()  # strong refs so fire-and-forget sends aren't GC'd
 
     # --------------------------
     # Error handling
@@ -27,73 +81,59 @@ class PlayerTrading(commands.Cog):
         await log_error(self.__class__.__name__, error, ctx)
         await ctx.send("⚠️ An internal error occurred. The issue has been logged.")
 
-    # --------------------------
-    # Channel check
-    # --------------------------
-    async def _check_channel(self, ctx):
-        return ctx.channel.name == "toilet-exchange"
-
     # --------------------------
     # start_trade / cancel
     # --------------------------
     @commands.command(name="start_trade")
     async def start_trade(self, ctx, target: str = None):
         """Start a trade or cancel one."""
-        if not await self._check_channel(ctx):
-            return await ctx.send("❌ Trades must happen in #toilet-exchange")
-
         guild_id = ctx.guild.id
         user_id = ctx.author.id
-        guild_trades = active_trades.setdefault(guild_id, {})
-
-        # Cancel trade
-        if target and target.lower() == "cancel":
-            if user_id not in guild_trades:
-                return await ctx.send("❌ You have no active trade to cancel.")
-            trade = guild_trades.pop(user_id)
-            partner_id = trade.get("partner_id")
-            if partner_id:
-                guild_trades.pop(partner_id, None)
-            msg = trade.get("message")
-            if msg:
-                await msg.edit(embed=self._trade_embed("❌ Trade cancelled.", color=discord.Color.red()))
-            return await ctx.send("🟥 Trade cancelled.")
-
-        # Prevent duplicate
-        if user_id in guild_trades:
-            return await ctx.send("⚠️ You already have an active trade.")
-
-        # Resolve target
-        partner = None
-        if target and target.lower() not in ("all", "cancel"):
-            partner = await resolve_member(self.bot, ctx, target)
-            if not partner:
-                return await ctx.send(f"❌ Could not find user `{target}` in this server.")
-            if partner.id == user_id:
-                return await ctx.send("❌ You can’t trade with yourself.")
-
-        # Create new trade
-        trade_data = {
-            "partner_id": partner.id if partner else None,
-            "mode": "targeted" if partner else "open",
-            "status": "pending",
-            "initiator_offer": {"cash": 0, "stocks": {}},
-            "partner_offer": {"cash": 0, "stocks": {}},
-            "message": None,
-        }
-
-        embed = self._trade_embed(
-            f"🟢 Trade started by **{ctx.author.display_name}**\n"
-            f"{'Waiting for ' + partner.display_name if partner else 'Open to anyone — type `!trade_accept` to join.'}\n\n"
-            "Once both users have joined:\n"
-            "• `!trade 100` to offer cash\n"
-            "• `!trade TICKER #` to offer stocks\n"
-            "• `!accept` to finalize or `!deny` to cancel."
-        )
-        msg = await ctx.send(embed=embed)
-        trade_data["message"] = msg
-        guild_trades[user_id] = trade_data
-        await ctx.send("✅ Trade created!")
+        async with self._lock(guild_id):
+            trade = self._find_trade(guild_id, user_id)
+
+            # Cancel trade
+            if target and target.lower() == "cancel":
+                if not trade:
+                    return await ctx.send("❌ You have no active trade to cancel.")
+                await self._end_trade(guild_id, trade)
+                embed = self._trade_embed("❌ Trade cancelled.", color=discord.Color.red())
+                return await trade.message.edit(embed=embed)
+
+            # Prevent duplicate
+            if trade:
+                return await ctx.send("⚠️ You already have an active trade.")
+
+            # Resolve target
+            partner = None
+            if target and target.lower() not in ("all", "cancel"):
+                partner = await resolve_member(self.bot, ctx, target)
+                if not partner:
+                    return await ctx.send(f"❌ Could not find user `{target}` in this server.")
+                if partner.id == user_id:
+                    return await ctx.send("❌ You can’t trade with yourself.")
+
+            # Create new trade
+            trade_data = TradeSession(
+                initiator_id=user_id,
+                partner_id=partner.id if partner else None,
+                mode="targeted" if partner else "open",
+                initiator_member=ctx.author,
+            )
+
+            embed = self._trade_embed(
+                f"🟢 Trade started by **{ctx.author.display_name}**\n"
+                f"{'Waiting for ' + partner.display_name if partner else 'Open to anyone — type `!trade_accept` to join.'}\n\n"
+                "Once both users have joined:\n"
+                "• `!trade 100` to offer cash\n"
+                "• `!trade TICKER #` to offer stocks\n"
+                "• `!accept` to finalize or `!deny` to cancel."
+            )
+            msg = await ctx.send(embed=embed)
+            trade_data.message = msg
+            active_trades.setdefault(guild_id, {})[user_id] = trade_data
+            user_index.setdefault(guild_id, {})[user_id] = user_id
+            self._index_pending(guild_id, trade_data)
 
     # --------------------------
     # Accept trade
@@ -101,41 +141,38 @@ class PlayerTrading(commands.Cog):
     @commands.command(name="trade_accept")
     async def trade_accept(self, ctx):
         """Join someone’s open or targeted trade."""
-        if not await self._check_channel(ctx):
-            return await ctx.send("❌ Trades must happen in #toilet-exchange")
-
         guild_id = ctx.guild.id
         user_id = ctx.author.id
-        guild_trades = active_trades.get(guild_id, {})
-
-        # Find a pending trade for this guild
-        target_trade = None
-        for uid, trade in guild_trades.items():
-            if trade["status"] == "pending":
-                if trade["mode"] == "open" and trade["partner_id"] is None:
-                    target_trade = uid
-                    break
-                elif trade["mode"] == "targeted" and trade["partner_id"] == user_id:
-                    target_trade = uid
-                    break
-
-        if not target_trade:
-            return await ctx.send("❌ No open trade found for you to join.")
-
-        initiator_id = target_trade
-        trade = guild_trades[initiator_id]
-        if initiator_id == user_id:
-            return await ctx.send("❌ You can’t accept your own trade.")
-
-        trade["partner_id"] = user_id
-        trade["status"] = "active"
-        guild_trades[user_id] = trade
-
-        initiator = ctx.guild.get_member(initiator_id)
-        partner = ctx.author
-        embed = self._trade_embed(f"🤝 Trade started between {initiator.display_name} and {partner.display_name}")
-        await trade["message"].edit(embed=embed)
-        await ctx.send("✅ Trade started!")
+        async with self._lock(guild_id):
+
+            # Trades aimed at this user take priority over open ones
+            waiting = targeted_trades.get(guild_id, {}).get(user_id)
+            if waiting:
+                initiator_id = next(iter(waiting))
+            else:
+                initiator_id = next(iter(open_trades.get(guild_id, {})), None)
+
+            if initiator_id is None:
+                return await ctx.send("❌ No open trade found for you to join.")
+
+            if initiator_id == user_id:
+                return await ctx.send("❌ You can’t accept your own trade.")
+            if self._find_trade(guild_id, user_id):
+                return await ctx.send("⚠️ You already have an active trade.")
+
+            trade = active_trades[guild_id][initiator_id]
+
+            self._unindex_pending(guild_id, trade)
+            trade.partner_id = user_id
+            trade.partner_member = ctx.author
+            trade.status = "active"
+            trade.embed = self._new_offer_embed(trade)
+            user_index[guild_id][user_id] = initiator_id
+
+            initiator = trade.initiator_member
+            partner = trade.partner_member
+            embed = self._trade_embed(f"🤝 Trade started between {initiator.display_name} and {partner.display_name}")
+            await trade.message.edit(embed=embed)
 
     # --------------------------
     # Offer
@@ -143,36 +180,41 @@ class PlayerTrading(commands.Cog):
     @commands.command(name="trade")
     async def trade(self, ctx, *args):
         """Offer money or stocks in an active trade."""
-        if not await self._check_channel(ctx):
-            return await ctx.send("❌ Trades must happen in #toilet-exchange")
-
         guild_id = ctx.guild.id
         user_id = ctx.author.id
-        guild_trades = active_trades.get(guild_id, {})
-
-        if user_id not in guild_trades:
-            return await ctx.send("❌ You’re not in a trade.")
-        trade = guild_trades[user_id]
-
-        initiator_id = [k for k, v in guild_trades.items() if v == trade][0]
-        trade_key = "initiator_offer" if initiator_id == user_id else "partner_offer"
-
-        if len(args) == 1 and args[0].isdigit():
-            cash = int(args[0])
-            trade[trade_key]["cash"] = cash
-            msg = f"💵 {ctx.author.display_name} now offers ${cash}."
-        elif len(args) == 2:
-            ticker, qty_str = args
-            if not qty_str.isdigit():
-                return await ctx.send("❌ Quantity must be a number.")
-            trade[trade_key]["stocks"][ticker.upper()] = int(qty_str)
-            msg = f"📊 {ctx.author.display_name} now offers {qty_str} × {ticker.upper()}."
-        else:
-            return await ctx.send("❌ Usage: `!trade 100` or `!trade GMD 2`")
-
-        embed = await self._build_trade_embed(ctx.guild, guild_trades, trade)
-        await trade["message"].edit(embed=embed)
-        await ctx.send(msg)
+        async with self._lock(guild_id):
+            trade = self._find_trade(guild_id, user_id)
+            if not trade:
+                return await ctx.send("❌ You’re not in a trade.")
+            if trade.status != "active":
+                return await ctx.send("⏳ Wait for someone to join your trade before making offers.")
+
+            offer = trade.offer_for(user_id)
+
+            if len(args) == 1 and args[0].isdigit():
+                cash = int(args[0])
+                changed = offer["cash"] != cash
+                offer["cash"] = cash
+                msg = f"💵 {ctx.author.display_name} now offers ${cash}."
+            elif len(args) == 2:
+                ticker, qty_str = args
+                if not qty_str.isdigit():
+                    return await ctx.send("❌ Quantity must be a number.")
+                ticker, qty = ticker.upper(), int(qty_str)
+                changed = offer["stocks"].get(ticker) != qty
+                offer["stocks"][ticker] = qty
+                msg = f"📊 {ctx.author.display_name} now offers {qty_str} × {ticker}."
+            else:
+                return await ctx.send("❌ Usage: `!trade 100` or `!trade GMD 2`")
+
+            # Repeating the current offer changes nothing on screen; skip the edit
+            if not changed:
+                return
+
+            # Earlier accepts were for the old terms
+            trade.initiator_accepted = trade.partner_accepted = False
+            self._render_offer(trade, user_id)
+            await self._schedule_edit(trade, last_action=msg)
 
     # --------------------------
     # Accept / Deny
@@ -180,47 +222,42 @@ class PlayerTrading(commands.Cog):
     @commands.command(name="accept")
     async def accept(self, ctx):
         """Accept a trade once both offers are ready."""
-        if not await self._check_channel(ctx):
-            return await ctx.send("❌ Trades must happen in #toilet-exchange")
-
         guild_id = ctx.guild.id
         user_id = ctx.author.id
-        guild_trades = active_trades.get(guild_id, {})
-        if user_id not in guild_trades:
-            return await ctx.send("❌ You’re not in a trade.")
-
-        trade = guild_trades[user_id]
-        trade.setdefault("accepts", set()).add(user_id)
-        partner_id = trade["partner_id"]
-
-        if len(trade["accepts"]) == 2:
-            await self._finalize_trade(ctx.guild, trade)
-            for uid in [user_id, partner_id]:
-                guild_trades.pop(uid, None)
-        else:
-            embed = self._trade_embed(f"✅ {ctx.author.display_name} accepted the trade.\nWaiting for the other party...")
-            await trade["message"].edit(embed=embed)
+        async with self._lock(guild_id):
+            trade = self._find_trade(guild_id, user_id)
+            if not trade:
+                return await ctx.send("❌ You’re not in a trade.")
+            if trade.status != "active":
+                return await ctx.send("⏳ Wait for someone to join your trade before accepting.")
+
+            await self._cancel_pending_edit(trade)
+            if user_id == trade.initiator_id:
+                trade.initiator_accepted = True
+            else:
+                trade.partner_accepted = True
+
+            if trade.initiator_accepted and trade.partner_accepted:
+                await self._finalize_trade(ctx.guild, trade)
+                await self._end_trade(guild_id, trade)
+            else:
+                # Keep both offers on screen and report the acceptance in the footer
+                last_action = f"✅ {ctx.author.display_name} accepted the trade. Waiting for the other party..."
+                await trade.message.edit(embed=self._build_trade_embed(trade, last_action=last_action))
 
     @commands.command(name="deny")
     async def deny(self, ctx):
         """Deny or cancel a trade."""
-        if not await self._check_channel(ctx):
-            return await ctx.send("❌ Trades must happen in #toilet-exchange")
-
         guild_id = ctx.guild.id
         user_id = ctx.author.id
-        guild_trades = active_trades.get(guild_id, {})
-
-        if user_id not in guild_trades:
-            return await ctx.send("❌ You’re not in a trade.")
-        trade = guild_trades.pop(user_id)
-        partner_id = trade.get("partner_id")
-        if partner_id:
-            guild_trades.pop(partner_id, None)
+        async with self._lock(guild_id):
+            trade = self._find_trade(guild_id, user_id)
+            if not trade:
+                return await ctx.send("❌ You’re not in a trade.")
+            await self._end_trade(guild_id, trade)
 
-        embed = self._trade_embed("❌ Trade denied.", color=discord.Color.red())
-        await trade["message"].edit(embed=embed)
-        await ctx.send("Trade cancelled.")
+            embed = self._trade_embed("❌ Trade denied.", color=discord.Color.red())
+            await trade.message.edit(embed=embed)
 
     # --------------------------
     # Helpers
@@ -228,114 +265,207 @@ class PlayerTrading(commands.Cog):
     def _trade_embed(self, text, color=discord.Color.blurple()):
         return discord.Embed(description=text, color=color)
 
-    async def _build_trade_embed(self, guild, guild_trades, trade):
-        initiator_id = [k for k, v in guild_trades.items() if v == trade][0]
-        initiator = guild.get_member(initiator_id)
-        partner = guild.get_member(trade["partner_id"])
-        io, po = trade["initiator_offer"], trade["partner_offer"]
-
+    def _new_offer_embed(self, trade):
         embed = discord.Embed(title="💱 Active Trade", color=discord.Color.gold())
-        embed.add_field(name=f"{initiator.display_name}'s Offer", value=self._format_offer(io), inline=True)
-        embed.add_field(name=f"{partner.display_name}'s Offer", value=self._format_offer(po), inline=True)
-        embed.set_footer(text="Use !accept or !deny to finish.")
+        embed.add_field(name=f"{trade.initiator_member.display_name}'s Offer", value="Nothing", inline=True)
+        embed.add_field(name=f"{trade.partner_member.display_name}'s Offer", value="Nothing", inline=True)
+        return embed
+
+    def _render_offer(self, trade, user_id):
+        """Re-render only `user_id`'s offer field on the shared embed."""
+        if user_id == trade.initiator_id:
+            index, member = 0, trade.initiator_member
+        else:
+            index, member = 1, trade.partner_member
+        trade.embed.set_field_at(
+            index, name=f"{member.display_name}'s Offer", value=self._format_offer(trade.offer_for(user_id)), inline=True
+        )
+
+    def _build_trade_embed(self, trade, last_action=None):
+        # Offer fields are kept current by _render_offer; only the footer changes here
+        embed = trade.embed
+        footer = "Use !accept or !deny to finish."
+        if last_action:
+            footer = f"Last action: {last_action}\n{footer}"
+        embed.set_footer(text=footer)
         return embed
 
+    def _index_pending(self, guild_id, trade):
+        if trade.mode == "open":
+            open_trades.setdefault(guild_id, {})[trade.initiator_id] = None
+        else:
+            targeted_trades.setdefault(guild_id, {}).setdefault(trade.partner_id, {})[trade.initiator_id] = None
+
+    def _unindex_pending(self, guild_id, trade):
+        if trade.mode == "open":
+            open_trades.get(guild_id, {}).pop(trade.initiator_id, None)
+            return
+        guild_targets = targeted_trades.get(guild_id, {})
+        waiting = guild_targets.get(trade.partner_id)
+        if waiting is not None:
+            waiting.pop(trade.initiator_id, None)
+            if not waiting:
+                del guild_targets[trade.partner_id]
+
+    def _lock(self, guild_id):
+        return _trade_locks.setdefault(guild_id, asyncio.Lock())
+
+    def _find_trade(self, guild_id, user_id):
+        """Return the trade `user_id` takes part in (either side), or None."""
+        initiator_id = user_index.get(guild_id, {}).get(user_id)
+        if initiator_id is None:
+            return None
+        return active_trades[guild_id][initiator_id]
+
+    async def _end_trade(self, guild_id, trade):
+        """Remove a trade from active_trades, user_index and the pending indexes."""
+        active_trades.get(guild_id, {}).pop(trade.initiator_id, None)
+        guild_users = user_index.get(guild_id, {})
+        guild_users.pop(trade.initiator_id, None)
+        if trade.status == "pending":
+            # A pending trade's partner_id is only the invited user, not a participant
+            self._unindex_pending(guild_id, trade)
+        else:
+            guild_users.pop(trade.partner_id, None)
+        await self._cancel_pending_edit(trade)
+
+    async def _schedule_edit(self, trade, last_action=None):
+        """Edit the trade embed after a short delay, replacing any edit still waiting."""
+        await self._cancel_pending_edit(trade)
+        task = asyncio.create_task(self._edit_after(trade, last_action))
+        trade.pending_edit = task
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _edit_after(self, trade, last_action):
+        # pending_edit stays set until the edit is done, so a cancel also covers
+        # an edit whose request is already in flight
+        try:
+            await asyncio.sleep(EDIT_DEBOUNCE_SECONDS)
+            await trade.message.edit(embed=self._build_trade_embed(trade, last_action=last_action))
+        except discord.HTTPException as e:
+            await log_error(self.__class__.__name__, e)
+        finally:
+            if trade.pending_edit is asyncio.current_task():
+                trade.pending_edit = None
+
+    def _send_in_background(self, channel, content):
+        task = asyncio.create_task(self._safe_send(channel, content))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _safe_send(self, channel, content):
+        try:
+            await channel.send(content)
+        except discord.HTTPException as e:
+            await log_error(self.__class__.__name__, e)
+
+    async def _cancel_pending_edit(self, trade):
+        """Stop a queued or in-flight offer edit and wait for it to finish, so it
+        can't land after a newer trade state."""
+        task = trade.pending_edit
+        if task is None:
+            return
+        trade.pending_edit = None
+        task.cancel()
+        # wait() rather than awaiting the task: it doesn't re-raise the CancelledError
+        await asyncio.wait({task})
+
     def _format_offer(self, offer):
-        items = []
-        if offer["cash"]:
-            items.append(f"${offer['cash']:,}")
-        for t, q in offer["stocks"].items():
-            items.append(f"{q} × {t}")
-        return "\n".join(items) if items else "Nothing"
+        cash = (f"${offer['cash']:,}",) if offer["cash"] else ()
+        stocks = (f"{q} × {t}" for t, q in offer["stocks"].items())
+        return "\n".join(itertools.chain(cash, stocks)) or "Nothing"
 
     async def _finalize_trade(self, guild, trade):
         """Finalize trade safely per guild."""
-        initiator = guild.get_member([k for k, v in active_trades[guild.id].items() if v == trade][0])
-        partner = guild.get_member(trade["partner_id"])
+        initiator, partner = trade.initiator_member, trade.partner_member
         if not initiator or not partner:
             return
 
-        io, po = trade["initiator_offer"], trade["partner_offer"]
+        io, po = trade.initiator_offer, trade.partner_offer
         guild_id = guild.id
 
-        # Validate cash and stock ownership
-        async def owns_stock(uid, t, q):
-            async with aiosqlite.connect(DB_PATH) as db:
-                cur = await db.execute("""
-                    SELECT SUM(CASE WHEN side='BUY' THEN qty ELSE -qty END)
-                    FROM trades
-                    WHERE user_id=? AND guild_id=? AND ticker=?
-                """, (str(uid), str(guild_id), t))
-                row = await cur.fetchone()
-                return (row[0] or 0) >= q
-
-        for ticker, qty in io["stocks"].items():
-            if not await owns_stock(initiator.id, ticker, qty):
-                return await self._trade_fail(trade, f"{initiator.display_name} doesn’t own {qty}×{ticker}.")
-        for ticker, qty in po["stocks"].items():
-            if not await owns_stock(partner.id, ticker, qty):
-                return await self._trade_fail(trade, f"{partner.display_name} doesn’t own {qty}×{ticker}.")
-
-        # Handle cash
-        initiator_user = await get_user(initiator.id, guild_id)
-        partner_user = await get_user(partner.id, guild_id)
-        if not initiator_user or not partner_user:
-            return await self._trade_fail(trade, "One or both traders are not registered.")
-
-        if io["cash"] > initiator_user[1]:
-            return await self._trade_fail(trade, f"{initiator.display_name} lacks funds.")
-        if po["cash"] > partner_user[1]:
-            return await self._trade_fail(trade, f"{partner.display_name} lacks funds.")
-
-        # Exchange cash
-        net_cash = io["cash"] - po["cash"]
-        if net_cash != 0:
-            await update_balance(initiator.id, guild_id, -net_cash)
-            await update_balance(partner.id, guild_id, net_cash)
-
-        # Exchange stocks
-        async with aiosqlite.connect(DB_PATH) as db:
-            for ticker, qty in io["stocks"].items():
-                if qty > 0:
-                    await record_trade(initiator.id, guild_id, ticker, qty, "SELL")
-                    await record_trade(partner.id, guild_id, ticker, qty, "BUY")
-            for ticker, qty in po["stocks"].items():
-                if qty > 0:
-                    await record_trade(partner.id, guild_id, ticker, qty, "SELL")
-                    await record_trade(initiator.id, guild_id, ticker, qty, "BUY")
+        # Verify and exchange everything in one transaction (one commit) so a
+        # failed check leaves no partial transfer behind. Empty trades skip the DB.
+        is_empty = not (io["cash"] or po["cash"] or io["stocks"] or po["stocks"])
+        if not is_empty:
+            async with writer.acquire() as db:
+                await db.execute("BEGIN IMMEDIATE")
+                reason = await self._exchange(db, guild_id, initiator, partner, io, po)
+                if reason:
+                    await db.rollback()
+                else:
+                    await db.commit()
+
+            if reason:
+                return await self._trade_fail(trade, reason)
 
         # Update message
-        summary = []
-        if io["cash"]:
-            summary.append(f"💵 {initiator.display_name} sent ${io['cash']:,}")
-        if po["cash"]:
-            summary.append(f"💵 {partner.display_name} sent ${po['cash']:,}")
-        for t, q in io["stocks"].items():
-            summary.append(f"📈 {initiator.display_name} gave {q} × {t}")
-        for t, q in po["stocks"].items():
-            summary.append(f"📈 {partner.display_name} gave {q} × {t}")
+        sides = ((initiator, io), (partner, po))
+        summary = "\n".join(itertools.chain(
+            (f"💵 {m.display_name} sent ${o['cash']:,}" for m, o in sides if o["cash"]),
+            (f"📈 {m.display_name} gave {q} × {t}" for m, o in sides for t, q in o["stocks"].items()),
+        ))
 
         embed = discord.Embed(
             title="✅ Trade Complete!",
             description=f"{initiator.display_name} and {partner.display_name} successfully completed a trade!",
             color=discord.Color.green()
         )
-        embed.add_field(name="Trade Summary", value="\n".join(summary) or "No items exchanged", inline=False)
-        await trade["message"].edit(embed=embed)
+        embed.add_field(name="Trade Summary", value=summary or "No items exchanged", inline=False)
+        await trade.message.edit(embed=embed)
 
-        channel = discord.utils.get(guild.text_channels, name="toilet-exchange")
-        if channel:
-            await channel.send(
-                f"💹 **Trade Completed!** {initiator.mention} and {partner.mention} have finalized their trade!"
-            )
+        # The trade message already lives in #toilet-exchange; announce there without waiting
+        self._send_in_background(
+            trade.message.channel,
+            f"💹 **Trade Completed!** {initiator.mention} and {partner.mention} have finalized their trade!"
+        )
+
+    async def _exchange(self, db, guild_id, initiator, partner, io, po):
+        """Validate both offers and apply the transfer on `db`.
+
+        Returns a failure reason, or None once everything has been written.
+        """
+        # Validate cash and stock ownership
+        for member, offer in ((initiator, io), (partner, po)):
+            if not offer["stocks"]:
+                continue
+            owned = await get_holdings_tx(db, member.id, guild_id, offer["stocks"])
+            for ticker, qty in offer["stocks"].items():
+                if owned.get(ticker, 0) < qty:
+                    return f"{member.display_name} doesn’t own {qty}×{ticker}."
+
+        balances = await get_balances_tx(db, guild_id, (initiator.id, partner.id))
+        initiator_cash = balances.get(initiator.id)
+        partner_cash = balances.get(partner.id)
+        if initiator_cash is None or partner_cash is None:
+            return "One or both traders are not registered."
+
+        if io["cash"] or po["cash"]:
+            if io["cash"] > initiator_cash:
+                return f"{initiator.display_name} lacks funds."
+            if po["cash"] > partner_cash:
+                return f"{partner.display_name} lacks funds."
+
+            # Exchange cash
+            net_cash = io["cash"] - po["cash"]
+            if net_cash != 0:
+                await transfer_cash_tx(db, guild_id, initiator.id, partner.id, net_cash)
 
-        # Cleanup
-        active_trades[guild_id].pop(initiator.id, None)
-        active_trades[guild_id].pop(partner.id, None)
+        # Exchange stocks
+        rows = []
+        for giver, receiver, offer in ((initiator, partner, io), (partner, initiator, po)):
+            for ticker, qty in offer["stocks"].items():
+                if qty > 0:
+                    rows.append((giver.id, guild_id, ticker, qty, "SELL"))
+                    rows.append((receiver.id, guild_id, ticker, qty, "BUY"))
+        if rows:
+            await record_trades_tx(db, rows)
+        return None
 
     async def _trade_fail(self, trade, reason):
         embed = discord.Embed(title="❌ Trade Failed", description=reason, color=discord.Color.red())
-        await trade["message"].edit(embed=embed)
+        await trade.message.edit(embed=embed)
 
 
 async def setup(bot):
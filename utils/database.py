@@ -1,6 +1,10 @@
 # database.py
+import asyncio
 import aiosqlite
 import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 
 DB_PATH = "data/market.db"
 
@@ -15,41 +19,238 @@ DEFAULT_STOCKS = [
     ("BPT", "Blood Potions", 700.00, "high"),
 ]
 
+# Hot-path statements kept as constants so every call (and executemany) reuses
+# the exact same SQL text, which SQLite's per-connection statement cache keys on
+INSERT_TRADE_SQL = "INSERT INTO trades(user_id, guild_id, ticker, qty, side) VALUES(?, ?, ?, ?, ?)"
+UPSERT_POSITION_SQL = """
+    INSERT INTO positions(user_id, guild_id, ticker, qty) VALUES(?, ?, ?, ?)
+    ON CONFLICT(user_id, guild_id, ticker) DO UPDATE SET qty = qty + excluded.qty
+"""
+SELECT_POSITION_SQL = "SELECT qty FROM positions WHERE user_id=? AND guild_id=? AND ticker=?"
+UPDATE_BALANCE_SQL = "UPDATE users SET cash = cash + ? WHERE discord_id=? AND guild_id=?"
+SELECT_USER_SQL = "SELECT discord_id, cash FROM users WHERE discord_id=? AND guild_id=?"
+
+# Statements each pooled connection keeps compiled (sqlite3 defaults to 128)
+CACHED_STATEMENTS = 256
+
+
+# journal_mode is stored in the database file, so it only needs setting once
+_wal_enabled = False
+
 
 async def connect():
-    return await aiosqlite.connect(DB_PATH)
+    """Open a standalone connection with the same tuning as the pooled ones."""
+    db = await aiosqlite.connect(DB_PATH, cached_statements=CACHED_STATEMENTS)
+    await _tune(db)
+    return db
+
+
+async def _tune(db, query_only=False):
+    global _wal_enabled
+    if not _wal_enabled:
+        await db.execute("PRAGMA journal_mode=WAL")
+        _wal_enabled = True
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute("PRAGMA busy_timeout=5000")
+    await db.execute("PRAGMA temp_store=MEMORY")
+    await db.execute("PRAGMA foreign_keys=ON")
+    await db.execute("PRAGMA cache_size=-65536")  # up to 64 MB page cache per connection
+    await db.execute("PRAGMA mmap_size=268435456")  # 256 MB memory-mapped reads
+    if query_only:
+        await db.execute("PRAGMA query_only=ON")
+
+
+class ConnectionPool:
+    """A fixed set of long-lived, tuned connections, each lent to one caller at a time."""
+
+    def __init__(self, path, size=4, query_only=False):
+        self._path = path
+        self._size = size
+        self._query_only = query_only
+        self._conns = []
+        self._idle = asyncio.Queue()
+        self._open_lock = asyncio.Lock()
+
+    async def _open(self):
+        async with self._open_lock:
+            if self._conns:
+                return
+            for _ in range(self._size):
+                db = await aiosqlite.connect(self._path, cached_statements=CACHED_STATEMENTS)
+                await _tune(db, query_only=self._query_only)
+                self._conns.append(db)
+                self._idle.put_nowait(db)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Borrow a connection; any transaction left open is rolled back on return."""
+        if not self._conns:
+            await self._open()
+        db = await self._idle.get()
+        try:
+            yield db
+        finally:
+            if db.in_transaction:
+                await db.rollback()
+            self._idle.put_nowait(db)
+
+    async def close(self):
+        conns, self._conns = self._conns, []
+        self._idle = asyncio.Queue()
+        for db in conns:
+            await db.close()
+
+
+# WAL lets readers run alongside a single writer. All writes queue for the one
+# writer connection instead of contending for SQLite's lock, and SELECT-only
+# work goes to the read-only pool. Code holding the writer must not call
+# helpers that acquire it again.
+writer = ConnectionPool(DB_PATH, size=1)
+readers = ConnectionPool(DB_PATH, size=4, query_only=True)
+
+
+class TTLCache:
+    """Size-capped LRU mapping whose entries expire `ttl` seconds after being set."""
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        stored_at, value = entry
+        if time.monotonic() - stored_at >= self.ttl:
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def pop_where(self, predicate):
+        for key in [k for k in self._data if predicate(k)]:
+            del self._data[key]
+
+
+# Read-mostly lookups hit on nearly every command; writers below invalidate them
+_settings_cache = TTLCache(ttl=30)   # guild_id -> settings dict
+_admin_cache = TTLCache(ttl=60)      # (guild_id, discord_id) -> bool
+_price_cache = TTLCache(ttl=30)      # (guild_id, symbol) -> price
+
+
+def invalidate_stock_prices(guild_id):
+    """Forget cached prices for a guild after writing to its stocks table directly."""
+    _price_cache.pop_where(lambda key: key[0] == guild_id)
+
+
+def invalidate_server_settings(guild_id):
+    """Forget cached settings for a guild after writing to server_settings directly."""
+    _settings_cache.pop(guild_id)
+
+
+# Discord ids used to be stored as TEXT. Databases from before the switch to
+# INTEGER have these tables moved aside, recreated by init_db and copied back.
+_ID_TABLES = (
+    "stocks", "price_history", "admins", "leaderboard_cache", "portfolios",
+    "users", "trades", "positions", "market_events", "server_settings",
+)
+
+
+async def _rename_legacy_tables(db):
+    """Rename TEXT-id tables to <name>_legacy and return the names that were moved."""
+    cur = await db.execute("SELECT type FROM pragma_table_info('users') WHERE name='discord_id'")
+    row = await cur.fetchone()
+    if not row or row[0] != "TEXT":
+        return []
+
+    placeholders = ",".join("?" * len(_ID_TABLES))
+    cur = await db.execute(
+        f"SELECT name FROM sqlite_master WHERE type='table' AND name IN ({placeholders})", _ID_TABLES
+    )
+    legacy = [name for (name,) in await cur.fetchall()]
+
+    # Indexes keep their names through a rename; free them for the new tables
+    cur = await db.execute("SELECT name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL")
+    for (name,) in await cur.fetchall():
+        await db.execute(f"DROP INDEX {name}")
+    for table in legacy:
+        await db.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+    return legacy
+
+
+async def _copy_legacy_tables(db, legacy):
+    """Copy renamed tables into their new definitions; INTEGER affinity converts the ids."""
+    for table in legacy:
+        await db.execute(f"INSERT INTO {table} SELECT * FROM {table}_legacy")
+        await db.execute(f"DROP TABLE {table}_legacy")
 
 
 async def init_db():
     """Initialize all database tables."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with writer.acquire() as db:
+        await db.execute("BEGIN IMMEDIATE")
+        legacy = await _rename_legacy_tables(db)
+        # Superseded by the covering idx_price_history_ticker_guild_id_price below
+        await db.execute("DROP INDEX IF EXISTS idx_price_history_ticker_guild_id")
+        cur = await db.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='index'")
+        indexes_before = (await cur.fetchone())[0]
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS stocks (
             ticker TEXT,
             name TEXT,
             price REAL,
             risk TEXT DEFAULT 'moderate' CHECK(risk IN ('low', 'moderate', 'high')),
-            guild_id TEXT,
+            guild_id INTEGER,
             PRIMARY KEY (ticker, guild_id)
         );
         """)
 
+        # Lets get_stock_price's "ticker=? OR name=?" use two index seeks, not a scan
+        await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_stocks_name_guild
+        ON stocks(name, guild_id);
+        """)
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS price_history (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             ticker TEXT,
-            guild_id TEXT,
+            guild_id INTEGER,
             price REAL,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         );
         """)
 
+        # Latest-N price lookups per stock (moving averages, !trend); carrying price
+        # makes it covering, so those reads never touch the table itself
+        await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_price_history_ticker_guild_id_price
+        ON price_history(ticker, guild_id, id DESC, price);
+        """)
+
+        # MAX(timestamp) per guild, checked by the market loop every minute
+        await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_price_history_guild_timestamp
+        ON price_history(guild_id, timestamp);
+        """)
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS admins (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            guild_id TEXT NOT NULL,
-            discord_id TEXT NOT NULL,
-            added_by TEXT,
+            guild_id INTEGER NOT NULL,
+            discord_id INTEGER NOT NULL,
+            added_by INTEGER,
             added_at DATETIME DEFAULT CURRENT_TIMESTAMP,
             UNIQUE(guild_id, discord_id)
         );
@@ -57,19 +258,25 @@ async def init_db():
 
         await db.execute("""
         CREATE TABLE IF NOT EXISTS leaderboard_cache (
-            guild_id TEXT,
-            user_id TEXT,
+            guild_id INTEGER,
+            user_id INTEGER,
             total_value REAL,
             last_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
             PRIMARY KEY (guild_id, user_id)
         );
         """)
 
+        # Top-N per guild straight from the index, without a sort
+        await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_leaderboard_cache_guild_value
+        ON leaderboard_cache(guild_id, total_value DESC);
+        """)
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS portfolios (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
-            guild_id TEXT NOT NULL,
+            guild_id INTEGER NOT NULL,
             ticker TEXT NOT NULL,
             qty INTEGER NOT NULL,
             avg_price REAL NOT NULL
@@ -79,19 +286,25 @@ async def init_db():
         await db.execute("""
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            discord_id TEXT,
-            guild_id TEXT,
+            discord_id INTEGER,
+            guild_id INTEGER,
             cash REAL DEFAULT 1000,
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
             UNIQUE(discord_id, guild_id)
         );
         """)
 
+        # Leaderboard rebuilds walk one guild's users
+        await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_users_guild
+        ON users(guild_id);
+        """)
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS trades (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            guild_id TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL,
             ticker TEXT NOT NULL,
             qty INTEGER NOT NULL,
             side TEXT NOT NULL CHECK(side IN ('BUY', 'SELL')),
@@ -100,10 +313,27 @@ async def init_db():
         );
         """)
 
+        # Position lookups filter on exactly these columns, in this order
+        await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_trades_user_guild_ticker
+        ON trades(user_id, guild_id, ticker);
+        """)
+
+        # Running share count per holder, kept in step with trades by record_trade(s)_tx
+        await db.execute("""
+        CREATE TABLE IF NOT EXISTS positions (
+            user_id INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL,
+            ticker TEXT NOT NULL,
+            qty INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, guild_id, ticker)
+        );
+        """)
+
         await db.execute("""
         CREATE TABLE IF NOT EXISTS market_events (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            guild_id TEXT,
+            guild_id INTEGER,
             event_type TEXT,
             year INTEGER,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
@@ -112,7 +342,7 @@ async def init_db():
 
         await db.execute("""
         CREATE TABLE IF NOT EXISTS server_settings (
-            guild_id TEXT PRIMARY KEY,
+            guild_id INTEGER PRIMARY KEY,
             leaderboard_post_time TEXT DEFAULT '23:00',  -- UTC
             leaderboard_update_rate INTEGER DEFAULT 10,  -- minutes
             market_update_rate INTEGER DEFAULT 1,        -- minutes
@@ -123,6 +353,24 @@ async def init_db():
         );
         """)
 
+        await _copy_legacy_tables(db, legacy)
+
+        # Backfill positions from existing trade history the first time the table appears
+        cur = await db.execute("SELECT EXISTS(SELECT 1 FROM positions), EXISTS(SELECT 1 FROM trades)")
+        has_positions, has_trades = await cur.fetchone()
+        if has_trades and not has_positions:
+            await db.execute("""
+            INSERT INTO positions (user_id, guild_id, ticker, qty)
+            SELECT user_id, guild_id, ticker, SUM(CASE WHEN side='BUY' THEN qty ELSE -qty END)
+            FROM trades
+            GROUP BY user_id, guild_id, ticker;
+            """)
+
+        # Give the planner statistics whenever an index above is new
+        cur = await db.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='index'")
+        if (await cur.fetchone())[0] != indexes_before:
+            await db.execute("ANALYZE")
+
         await db.commit()
 
 
@@ -131,137 +379,259 @@ async def init_db():
 # --------------------------
 async def ensure_guild_market(guild_id):
     """Ensure the guild has default stock data."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT COUNT(*) FROM stocks WHERE guild_id=?", (str(guild_id),))
+    async with writer.acquire() as db:
+        # Check and insert under one write lock so concurrent callers can't both
+        # see an empty market; OR IGNORE makes a repeated insert harmless anyway
+        await db.execute("BEGIN IMMEDIATE")
+        cur = await db.execute("SELECT COUNT(*) FROM stocks WHERE guild_id=?", (guild_id,))
         count = (await cur.fetchone())[0]
 
         if count == 0:
             await db.executemany(
-                "INSERT INTO stocks(ticker, name, price, risk, guild_id) VALUES (?, ?, ?, ?, ?)",
-                [(t, n, p, r, str(guild_id)) for (t, n, p, r) in DEFAULT_STOCKS]
+                "INSERT OR IGNORE INTO stocks(ticker, name, price, risk, guild_id) VALUES (?, ?, ?, ?, ?)",
+                [(t, n, p, r, guild_id) for (t, n, p, r) in DEFAULT_STOCKS]
             )
-            await db.commit()
-            print(f"✅ Inserted default stock data for guild {guild_id}")
-        else:
-            print(f"ℹ️ Skipped defaults; {count} stocks already exist for guild {guild_id}")
+        await db.commit()
+
+    if count == 0:
+        print(f"✅ Inserted default stock data for guild {guild_id}")
+    else:
+        print(f"ℹ️ Skipped defaults; {count} stocks already exist for guild {guild_id}")
 
 
 # --------------------------
 # User management
 # --------------------------
 async def get_user(discord_id, guild_id):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            "SELECT discord_id, cash FROM users WHERE discord_id=? AND guild_id=?",
-            (str(discord_id), str(guild_id))
-        )
-        row = await cur.fetchone()
-        if row:
-            return (row[0], float(row[1]))
-        return None
+    async with readers.acquire() as db:
+        return await get_user_tx(db, discord_id, guild_id)
 
 
-async def create_user(discord_id, guild_id):
-    from utils.database import get_server_settings
-    settings = await get_server_settings(guild_id)
-    starting_money = settings.get("starting_money", 1000.0)
+async def get_user_tx(db, discord_id, guild_id):
+    """Same as get_user, but runs on an already open connection."""
+    cur = await db.execute(SELECT_USER_SQL, (discord_id, guild_id))
+    row = await cur.fetchone()
+    if row:
+        return (row[0], float(row[1]))
+    return None
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT OR IGNORE INTO users(discord_id, guild_id, cash) VALUES(?, ?, ?)",
-            (str(discord_id), str(guild_id), float(starting_money))
-        )
+
+async def create_user(discord_id, guild_id):
+    """Create the account; returns (id, cash), or None if it already existed."""
+    async with writer.acquire() as db:
+        cur = await db.execute("""
+            INSERT INTO users(discord_id, guild_id, cash)
+            VALUES(?, ?, COALESCE(
+                (SELECT starting_money FROM server_settings WHERE guild_id=?), 1000.0
+            ))
+            ON CONFLICT DO NOTHING
+            RETURNING id, cash
+        """, (discord_id, guild_id, guild_id))
+        row = await cur.fetchone()
         await db.commit()
+    return row
 
 
 async def update_balance(discord_id, guild_id, delta):
+    async with writer.acquire() as db:
+        await update_balance_tx(db, discord_id, guild_id, delta)
+        await db.commit()
+
+
+async def update_balance_tx(db, discord_id, guild_id, delta):
+    """Same as update_balance, but leaves committing to the caller."""
     # Ensure SQLite gets a float, not Decimal
     if not isinstance(delta, (int, float)):
         delta = float(delta)
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "UPDATE users SET cash = cash + ? WHERE discord_id=? AND guild_id=?",
-            (delta, str(discord_id), str(guild_id))
-        )
-        await db.commit()
+    await db.execute(UPDATE_BALANCE_SQL, (delta, discord_id, guild_id))
+
+
+async def get_balances_tx(db, guild_id, discord_ids):
+    """Return {discord_id: cash} for registered users among `discord_ids`."""
+    ids = list(discord_ids)
+    placeholders = ",".join("?" * len(ids))
+    cur = await db.execute(
+        f"SELECT discord_id, cash FROM users WHERE guild_id=? AND discord_id IN ({placeholders})",
+        (guild_id, *ids)
+    )
+    return {discord_id: float(cash) for discord_id, cash in await cur.fetchall()}
+
+
+async def transfer_cash_tx(db, guild_id, from_id, to_id, amount):
+    """Move `amount` from one user to another with a single UPDATE."""
+    if not isinstance(amount, (int, float)):
+        amount = float(amount)
+
+    await db.execute(
+        """
+        UPDATE users SET cash = cash + CASE discord_id WHEN ? THEN ? ELSE ? END
+        WHERE guild_id=? AND discord_id IN (?, ?)
+        """,
+        (from_id, -amount, amount, guild_id, from_id, to_id)
+    )
 
 
 # --------------------------
 # Trading and stocks
 # --------------------------
 async def record_trade(user_id, guild_id, ticker, qty, side):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO trades(user_id, guild_id, ticker, qty, side) VALUES(?, ?, ?, ?, ?)",
-            (str(user_id), str(guild_id), ticker.upper(), qty, side.upper())
-        )
+    async with writer.acquire() as db:
+        result = await record_trade_tx(db, user_id, guild_id, ticker, qty, side)
         await db.commit()
+    return result
+
+
+async def record_trade_tx(db, user_id, guild_id, ticker, qty, side):
+    """Same as record_trade, but leaves committing to the caller."""
+    await record_trades_tx(db, [(user_id, guild_id, ticker, qty, side)])
     return f"Recorded {side.upper()} trade for {qty} {ticker.upper()}."
 
 
+async def record_trades_tx(db, rows):
+    """Insert many (user_id, guild_id, ticker, qty, side) trades and update positions."""
+    rows = [(u, g, t.upper(), q, side.upper()) for (u, g, t, q, side) in rows]
+    await db.executemany(INSERT_TRADE_SQL, rows)
+    await db.executemany(
+        UPSERT_POSITION_SQL,
+        [(u, g, t, q if side == "BUY" else -q) for (u, g, t, q, side) in rows]
+    )
+
+
+async def get_holdings_tx(db, user_id, guild_id, tickers):
+    """Return {ticker: shares owned} for the given tickers in one query."""
+    tickers = list(tickers)
+    if not tickers:
+        return {}
+    placeholders = ",".join("?" * len(tickers))
+    cur = await db.execute(
+        f"SELECT ticker, qty FROM positions WHERE user_id=? AND guild_id=? AND ticker IN ({placeholders})",
+        (user_id, guild_id, *tickers)
+    )
+    return dict(await cur.fetchall())
+
+
 async def get_stock_price(symbol, guild_id):
-    async with aiosqlite.connect(DB_PATH) as db:
+    key = (guild_id, symbol.upper())
+    price = _price_cache.get(key)
+    if price is not None:
+        return price
+
+    async with readers.acquire() as db:
         cur = await db.execute(
             "SELECT price FROM stocks WHERE (ticker=? OR name=?) AND guild_id=?",
-            (symbol.upper(), symbol.title(), str(guild_id))
+            (symbol.upper(), symbol.title(), guild_id)
         )
         row = await cur.fetchone()
-        return row[0] if row else None
+    if not row:
+        return None
+    _price_cache.set(key, row[0])
+    return row[0]
 
 
 async def update_stock_price(ticker, price, guild_id):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with writer.acquire() as db:
         await db.execute(
             "UPDATE stocks SET price=? WHERE ticker=? AND guild_id=?",
-            (price, ticker.upper(), str(guild_id))
+            (price, ticker.upper(), guild_id)
         )
         await db.commit()
+    invalidate_stock_prices(guild_id)
+
+
+async def record_prices_tx(db, guild_id, rows):
+    """Set new prices for many (ticker, price) rows and log them to price_history."""
+    await db.executemany(
+        "UPDATE stocks SET price=? WHERE ticker=? AND guild_id=?",
+        [(round(price, 6), ticker, guild_id) for ticker, price in rows]
+    )
+    await db.executemany(
+        "INSERT INTO price_history (ticker, guild_id, price) VALUES (?, ?, ?)",
+        [(ticker, guild_id, price) for ticker, price in rows]
+    )
+
+
+# Tickers fetched per get_recent_prices query. Every query has exactly this many
+# UNION ALL branches (unused ones get LIMIT 0), so its SQL text stays cacheable and
+# far below SQLite's 500-term compound SELECT limit.
+RECENT_PRICES_BATCH = 16
+RECENT_PRICES_SQL = " UNION ALL ".join(
+    ["SELECT * FROM (SELECT ticker, price, id FROM price_history"
+     " WHERE ticker=? AND guild_id=? ORDER BY id DESC LIMIT ?)"] * RECENT_PRICES_BATCH
+) + " ORDER BY id"
+
+
+async def get_recent_prices(guild_id, tickers, limit=20):
+    """Return {ticker: [price, ...]} with each ticker's last `limit` prices, oldest first."""
+    tickers = list(dict.fromkeys(tickers))
+    history = {}
+    async with readers.acquire() as db:
+        # Each branch is its own index seek with LIMIT; one query per batch of tickers
+        for start in range(0, len(tickers), RECENT_PRICES_BATCH):
+            batch = tickers[start:start + RECENT_PRICES_BATCH]
+            params = []
+            for ticker in batch:
+                params += (ticker, guild_id, limit)
+            params += (None, guild_id, 0) * (RECENT_PRICES_BATCH - len(batch))
+            cur = await db.execute(RECENT_PRICES_SQL, params)
+            for ticker, price, _ in await cur.fetchall():
+                history.setdefault(ticker, []).append(price)
+    return history
 
 
 async def get_moving_average(ticker, guild_id, window=5):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            "SELECT price FROM price_history WHERE ticker=? AND guild_id=? ORDER BY id DESC LIMIT ?",
-            (ticker.upper(), str(guild_id), window)
-        )
-        prices = [row[0] for row in await cur.fetchall()]
-        if not prices:
-            return None
-        return sum(prices) / len(prices)
+    async with readers.acquire() as db:
+        # Averaged inside SQLite so one row comes back; AVG over no rows is NULL -> None
+        cur = await db.execute("""
+            SELECT AVG(price) FROM (
+                SELECT price FROM price_history
+                WHERE ticker=? AND guild_id=?
+                ORDER BY id DESC LIMIT ?
+            )
+        """, (ticker.upper(), guild_id, window))
+        return (await cur.fetchone())[0]
 
 # --------------------------
 # Admin management (server-specific)
 # --------------------------
 async def is_admin(discord_id, guild_id):
-    async with aiosqlite.connect(DB_PATH) as db:
+    key = (guild_id, discord_id)
+    cached = _admin_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async with readers.acquire() as db:
         cur = await db.execute(
             "SELECT 1 FROM admins WHERE discord_id=? AND guild_id=?",
-            (str(discord_id), str(guild_id)),
+            (discord_id, guild_id),
         )
-        return bool(await cur.fetchone())
+        result = bool(await cur.fetchone())
+    _admin_cache.set(key, result)
+    return result
 
 async def add_admin(discord_id, guild_id, added_by=None):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with writer.acquire() as db:
         await db.execute(
             "INSERT OR IGNORE INTO admins (discord_id, guild_id, added_by) VALUES (?, ?, ?)",
-            (str(discord_id), str(guild_id), str(added_by) if added_by else None),
+            (discord_id, guild_id, added_by),
         )
         await db.commit()
+    _admin_cache.pop((guild_id, discord_id))
 
 async def remove_admin(discord_id, guild_id):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with writer.acquire() as db:
         await db.execute(
             "DELETE FROM admins WHERE discord_id=? AND guild_id=?",
-            (str(discord_id), str(guild_id)),
+            (discord_id, guild_id),
         )
         await db.commit()
+    _admin_cache.pop((guild_id, discord_id))
 
 async def list_admins(guild_id):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with readers.acquire() as db:
         cur = await db.execute(
             "SELECT discord_id, added_at FROM admins WHERE guild_id=?",
-            (str(guild_id),),
+            (guild_id,),
         )
         return await cur.fetchall()
 
@@ -270,56 +640,62 @@ async def list_admins(guild_id):
 # Leaderboards
 # --------------------------
 async def get_leaderboard(guild_id, limit=10):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with readers.acquire() as db:
         query = """
         SELECT u.discord_id,
                u.cash + IFNULL(SUM(p.qty * s.price), 0) AS total_value
         FROM users u
-        LEFT JOIN portfolios p ON u.id = p.user_id AND p.guild_id = u.guild_id
+        LEFT JOIN positions p ON u.discord_id = p.user_id AND u.guild_id = p.guild_id
         LEFT JOIN stocks s ON p.ticker = s.ticker AND s.guild_id = u.guild_id
         WHERE u.guild_id=?
-        GROUP BY u.id
+        GROUP BY u.discord_id
         ORDER BY total_value DESC
         LIMIT ?;
         """
-        cur = await db.execute(query, (str(guild_id), limit))
+        cur = await db.execute(query, (guild_id, limit))
         rows = await cur.fetchall()
     return rows
 
 async def update_leaderboard_cache(guild_id):
-    """Rebuild leaderboard cache for a specific guild."""
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Clear old entries for this guild
-        await db.execute("DELETE FROM leaderboard_cache WHERE guild_id=?", (str(guild_id),))
-
-        # Recompute leaderboard values
+    """Refresh leaderboard cache for a specific guild."""
+    async with writer.acquire() as db:
+        # Value holdings from the running positions totals rather than re-summing
+        # every trade, and update rows in place instead of clearing the guild first
         await db.execute("""
-        INSERT INTO leaderboard_cache (guild_id, user_id, total_value)
+        INSERT INTO leaderboard_cache (guild_id, user_id, total_value, last_updated)
         SELECT
             u.guild_id,
             u.discord_id,
-            u.cash + IFNULL(SUM(
-                (CASE WHEN t.side='BUY' THEN t.qty ELSE -t.qty END) * s.price
-            ), 0) AS total_value
+            u.cash + IFNULL(SUM(p.qty * s.price), 0) AS total_value,
+            CURRENT_TIMESTAMP
         FROM users u
-        LEFT JOIN trades t ON u.discord_id = t.user_id AND u.guild_id = t.guild_id
-        LEFT JOIN stocks s ON t.ticker = s.ticker AND s.guild_id = u.guild_id
+        LEFT JOIN positions p ON u.discord_id = p.user_id AND u.guild_id = p.guild_id
+        LEFT JOIN stocks s ON p.ticker = s.ticker AND s.guild_id = u.guild_id
         WHERE u.guild_id=?
-        GROUP BY u.discord_id;
-        """, (str(guild_id),))
+        GROUP BY u.discord_id
+        ON CONFLICT(guild_id, user_id) DO UPDATE SET
+            total_value = excluded.total_value,
+            last_updated = excluded.last_updated;
+        """, (guild_id,))
+
+        # Drop rows for accounts that have since been deleted
+        await db.execute("""
+        DELETE FROM leaderboard_cache
+        WHERE guild_id=? AND user_id NOT IN (SELECT discord_id FROM users WHERE guild_id=?);
+        """, (guild_id, guild_id))
 
         await db.commit()
 
 async def get_cached_leaderboard(guild_id, limit=10):
     """Retrieve cached leaderboard entries for a guild."""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with readers.acquire() as db:
         cur = await db.execute("""
             SELECT user_id, total_value, last_updated
             FROM leaderboard_cache
             WHERE guild_id=?
             ORDER BY total_value DESC
             LIMIT ?;
-        """, (str(guild_id), limit))
+        """, (guild_id, limit))
         return await cur.fetchall()
 
 
@@ -327,24 +703,53 @@ async def get_cached_leaderboard(guild_id, limit=10):
 # Server settings
 # --------------------------
 async def get_server_settings(guild_id):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT * FROM server_settings WHERE guild_id=?", (str(guild_id),))
+    cached = _settings_cache.get(guild_id)
+    if cached is not None:
+        return dict(cached)
+
+    async with readers.acquire() as db:
+        cur = await db.execute("SELECT * FROM server_settings WHERE guild_id=?", (guild_id,))
         row = await cur.fetchone()
-        if not row:
-            await db.execute("INSERT INTO server_settings(guild_id) VALUES(?)", (str(guild_id),))
-            await db.commit()
-            cur = await db.execute("SELECT * FROM server_settings WHERE guild_id=?", (str(guild_id),))
+    if not row:
+        # No-op upsert so RETURNING yields the row whether or not it already existed
+        async with writer.acquire() as db:
+            cur = await db.execute(
+                "INSERT INTO server_settings(guild_id) VALUES(?) "
+                "ON CONFLICT(guild_id) DO UPDATE SET guild_id=excluded.guild_id "
+                "RETURNING *",
+                (guild_id,),
+            )
             row = await cur.fetchone()
-        columns = [col[0] for col in cur.description]
-        return dict(zip(columns, row))
+            await db.commit()
+    columns = [col[0] for col in cur.description]
+    settings = dict(zip(columns, row))
+    _settings_cache.set(guild_id, settings)
+    return dict(settings)
+
+
+# One fixed statement per editable column; setting names never reach the SQL text
+_SETTING_SQL = {
+    col: f"UPDATE server_settings SET {col}=? WHERE guild_id=?"
+    for col in (
+        "leaderboard_post_time",
+        "leaderboard_update_rate",
+        "market_update_rate",
+        "starting_money",
+        "secret_profiles",
+        "market_bias",
+        "target_price",
+    )
+}
 
 
 async def update_server_setting(guild_id, setting, value):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            f"UPDATE server_settings SET {setting}=? WHERE guild_id=?",
-            (value, str(guild_id))
-        )
+    sql = _SETTING_SQL.get(setting)
+    if sql is None:
+        raise ValueError(f"Unknown server setting: {setting!r}")
+
+    async with writer.acquire() as db:
+        await db.execute(sql, (value, guild_id))
         await db.commit()
+    invalidate_server_settings(guild_id)
 
 
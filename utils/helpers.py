@@ -43,23 +43,25 @@ async def resolve_member(bot, ctx, user_text: str):
     # 2) ID
     txt = user_text.strip().lstrip("<@!>").rstrip(">")
     if txt.isdigit():
+        member = ctx.guild.get_member(int(txt))
+        if member:
+            return member
         try:
             return await ctx.guild.fetch_member(int(txt))
         except Exception:
             pass
 
-    # 3) Exact display_name or name (case-insensitive) from cache
+    # 3+4) Exact display_name or name (case-insensitive) from cache, else partials,
+    # classified in one pass over the member list
     lower = user_text.lower()
-    exact = discord.utils.find(
-        lambda m: m.display_name.lower() == lower or m.name.lower() == lower,
-        ctx.guild.members
-    )
-    if exact:
-        return exact
-
-    # 4) Partial match (case-insensitive)
-    partials = [m for m in ctx.guild.members
-                if lower in m.display_name.lower() or lower in m.name.lower()]
+    partials = []
+    for m in ctx.guild.members:
+        display, name = m.display_name.lower(), m.name.lower()
+        if display == lower or name == lower:
+            return m
+        if lower in display or lower in name:
+            partials.append(m)
+
     if len(partials) == 1:
         return partials[0]
     if len(partials) > 1:
@@ -69,33 +71,50 @@ async def resolve_member(bot, ctx, user_text: str):
         return None
 
     # 5) As a last resort, fetch the full member list (requires Members Intent)
+    first_partial = None
     try:
         async for m in ctx.guild.fetch_members(limit=None):
-            if m.display_name.lower() == lower or m.name.lower() == lower:
-                return m
-        async for m in ctx.guild.fetch_members(limit=None):
-            if lower in m.display_name.lower() or lower in m.name.lower():
+            display, name = m.display_name.lower(), m.name.lower()
+            if display == lower or name == lower:
                 return m
+            if first_partial is None and (lower in display or lower in name):
+                first_partial = m
     except Exception:
         pass
 
-    return None
+    return first_partial
+
+# guild_id -> id of its #toilet-exchange channel, so announcements skip the channel scan
+_exchange_channel_ids: dict[int, int] = {}
+
+
+def get_exchange_channel(guild):
+    """Return the guild's #toilet-exchange channel, or None if it has none."""
+    channel = guild.get_channel(_exchange_channel_ids.get(guild.id, 0))
+    # A cached id goes stale if the channel is deleted or renamed; rescan then
+    if channel is None or channel.name != "toilet-exchange":
+        channel = discord.utils.get(guild.text_channels, name="toilet-exchange")
+        if channel is None:
+            _exchange_channel_ids.pop(guild.id, None)
+            return None
+        _exchange_channel_ids[guild.id] = channel.id
+    return channel
 
 async def is_bot_admin(ctx):
     """Allow full admins or users with bot management permissions."""
     perms = ctx.author.guild_permissions
     return perms.administrator or perms.manage_guild or perms.manage_webhooks
 
+_PRICE_CHANGE_RANGES = {
+    "low": (-0.02, 0.02),        # ±2%
+    "moderate": (-0.05, 0.05),   # ±5%
+    "high": (-0.15, 0.15),       # ±15%
+}
+
+
 def get_price_change_range(risk: str) -> tuple[float, float]:
     """Return (min, max) price movement multiplier based on risk level."""
-    risk = (risk or "moderate").lower()
-    if risk == "low":
-        return (-0.02, 0.02)   # ±2%
-    elif risk == "moderate":
-        return (-0.05, 0.05)   # ±5%
-    elif risk == "high":
-        return (-0.15, 0.15)   # ±15%
-    return (-0.05, 0.05)
+    return _PRICE_CHANGE_RANGES.get((risk or "moderate").lower(), _PRICE_CHANGE_RANGES["moderate"])
 
 def bot_admin():
     """Decorator for commands restricted to bot admins."""
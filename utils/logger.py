@@ -1,4 +1,5 @@
 # utils/logger.py
+import asyncio
 import errno
 import os
 import glob
@@ -15,12 +16,20 @@ def _week_key(dt: datetime):
     iso = dt.isocalendar()
     return iso.year, iso.week
 
+# (year, week, path) of the current log file; recomputed when the ISO week rolls over
+_cached_path: tuple[int, int, str] | None = None
+
 def _current_log_path():
+    global _cached_path
     now = datetime.now(UTC)  # use timezone-aware UTC datetime
     year, week = _week_key(now)
+    if _cached_path is not None and _cached_path[:2] == (year, week):
+        return _cached_path[2]
     filename = f"{LOG_PREFIX}{year}-W{week:02d}{LOG_EXT}"
     os.makedirs(LOG_DIR, exist_ok=True)
-    return os.path.join(LOG_DIR, filename)
+    path = os.path.join(LOG_DIR, filename)
+    _cached_path = (year, week, path)
+    return path
 
 def _list_log_files():
     return sorted(glob.glob(os.path.join(LOG_DIR, f"{LOG_PREFIX}*{LOG_EXT}")))
@@ -37,6 +46,63 @@ def _prune_old_logs(keep: int = 2):
                 else:
                     pass
 
+def _format_entry(source: str, error: Exception, ctx_info: str, timestamp: str):
+    return (
+        f"[{timestamp}] [ERROR] [{source}]{ctx_info}\n"
+        f"{error}\n"
+        f"{''.join(traceback.format_exception(type(error), error, error.__traceback__))}\n"
+    )
+
+def _format_entries(entries):
+    return "".join(_format_entry(*entry) for entry in entries)
+
+# (source, error, ctx_info, timestamp) queued by log_error; a single writer task
+# formats and appends them in batches
+_log_queue: asyncio.Queue[tuple] = asyncio.Queue()
+_log_writer_task: asyncio.Task | None = None
+
+async def _append_log(path: str, text: str):
+    async with aiofiles.open(path, "a", encoding="utf-8") as f:
+        await f.write(text)
+
+async def _log_writer():
+    """Drain the queue, writing every entry that's ready with one file open."""
+    while True:
+        entries = [await _log_queue.get()]
+        while not _log_queue.empty():
+            entries.append(_log_queue.get_nowait())
+        try:
+            # Traceback formatting is pure-Python CPU work; keep it off the event loop
+            text = await asyncio.to_thread(_format_entries, entries)
+            path = _current_log_path()
+            try:
+                await _append_log(path, text)
+            except FileNotFoundError:
+                # The directory is only created once per week; recreate it if it was removed
+                os.makedirs(LOG_DIR, exist_ok=True)
+                await _append_log(path, text)
+        except Exception as e:
+            print(f"[logger] Failed to write {len(entries)} log entries: {e}")
+        finally:
+            for _ in entries:
+                _log_queue.task_done()
+
+async def flush_logs():
+    """Wait until every queued entry has been written."""
+    if _log_writer_task is not None and not _log_writer_task.done():
+        await _log_queue.join()
+
+PRUNE_INTERVAL = 3600  # seconds
+
+async def periodic_log_prune(keep: int = 2):
+    """Prune old weekly logs hourly, off the event loop, for the life of the bot."""
+    while True:
+        try:
+            await asyncio.to_thread(_prune_old_logs, keep)
+        except Exception as e:
+            print(f"[logger] Failed to prune old logs: {e}")
+        await asyncio.sleep(PRUNE_INTERVAL)
+
 async def log_error(source: str, error: Exception, ctx=None):
     """
     Log errors or exceptions (no info logs).
@@ -47,14 +113,8 @@ async def log_error(source: str, error: Exception, ctx=None):
         user = getattr(ctx, "author", None)
         guild = getattr(ctx, "guild", None)
         ctx_info = f" | User: {user} ({getattr(user, 'id', 'N/A')}) | Guild: {getattr(guild, 'name', 'DM')}"
-    entry = (
-        f"[{timestamp}] [ERROR] [{source}]{ctx_info}\n"
-        f"{error}\n"
-        f"{''.join(traceback.format_exception(type(error), error, error.__traceback__))}\n"
-    )
-
-    path = _current_log_path()
-    async with aiofiles.open(path, "a", encoding="utf-8") as f:
-        await f.write(entry)
 
-    _prune_old_logs(keep=2)
\ No newline at end of file
+    global _log_writer_task
+    if _log_writer_task is None or _log_writer_task.done():
+        _log_writer_task = asyncio.create_task(_log_writer())
+    _log_queue.put_nowait((source, error, ctx_info, timestamp))
\ No newline at end of file